@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Benchmark the copyright header updaters on a synthetic repository.
+
+A deterministic tree generator builds a source tree from the language
+mix in config3.yaml, with configurable file count, size distribution,
+shbang ratio, binary ratio and ratio of files that already carry a
+header. Each updater is then run end-to-end in dryrun and update mode
+against a freshly generated copy of the tree, and the timings are
+written to a JSON results file that can be tracked over time.
+
+Legacy updaters (scripts/updater_v3.py, scripts/updater-v4.py,
+scripts/udater_v5.py) get a config.yaml converted to their flat
+headers/extensions/shbang_patterns layout. updater_new.py also reports
+its per-stage timings via --report.
+
+Usage:
+  python3 benchmark.py --files 5000 --output bench.json
+  python3 benchmark.py --files 500 --tool updater_new.py --new-args "-j 8"
+"""
+
+import os
+import sys
+import argparse
+import json
+import math
+import platform
+import random
+import resource
+import shlex
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple
+import logging
+from pathlib import Path
+from datetime import datetime
+
+BENCH_DIR = Path(__file__).parent
+DEFAULT_TOOLS = [
+    'scripts/updater_v3.py',
+    'scripts/updater-v4.py',
+    'scripts/udater_v5.py',
+    'updater_new.py',
+]
+NEW_TOOL = 'updater_new.py'
+MODES = ('dryrun', 'update')
+FILES_PER_DIR = 50
+FILLER_LINES = 16384
+
+class TreeSpec(NamedTuple):
+    """Parameters of a generated tree; the same spec always yields the same tree."""
+    files: int = 2000
+    seed: int = 1
+    mix: Optional[Dict[str, float]] = None
+    size_median: int = 2048
+    size_sigma: float = 1.0
+    size_max: int = 1 << 20
+    shbang_ratio: float = 0.1
+    binary_ratio: float = 0.05
+    header_ratio: float = 0.3
+
+def load_languages(config_path: Path) -> Dict[str, Any]:
+    """Load the full configuration in the updater_new.py (languages:) layout."""
+    import yaml
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def legacy_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert the languages: layout to the flat layout of the v1-v5 scripts."""
+    headers = {}
+    extensions = {}
+    shbang_patterns = {}
+    for lang, spec in config['languages'].items():
+        headers[lang] = {'prefix': spec.get('prefix', ''), 'suffix': spec.get('suffix', '')}
+        for ext in spec.get('extensions', []):
+            extensions[ext] = lang
+        patterns = spec.get('shbang_patterns', [])
+        if patterns:
+            # One pattern per language; the shortest one matches the others
+            shbang_patterns[lang] = min(patterns, key=len)
+    return {
+        'headers': headers,
+        'extensions': extensions,
+        'shbang_patterns': shbang_patterns,
+        'exclude_dirs': config['exclude_dirs'],
+        'copyright_text': config['copyright_text'],
+    }
+
+def make_filler(rng: random.Random) -> Tuple[bytes, List[int]]:
+    """Build a block of code-like text and the offsets where its lines start."""
+    words = ['value', 'count', 'result', 'index', 'buffer', 'config', 'item', 'total']
+    lines = []
+    for i in range(FILLER_LINES):
+        lines.append(f"{rng.choice(words)}_{i} = {rng.choice(words)}({rng.randrange(1000)})\n")
+    filler = ''.join(lines).encode('ascii')
+    offsets = [0]
+    for line in lines[:-1]:
+        offsets.append(offsets[-1] + len(line))
+    return filler, offsets
+
+def generate_tree(root: Path, spec: TreeSpec, config: Dict[str, Any]) -> Dict[str, int]:
+    """Write the tree described by spec under root and return its composition."""
+    rng = random.Random(spec.seed)
+    languages = config['languages']
+    mix = spec.mix or {lang: 1.0 for lang in languages}
+    names = [lang for lang in mix if lang in languages and languages[lang].get('extensions')]
+    weights = [mix[lang] for lang in names]
+    filler, offsets = make_filler(rng)
+    copyright_text = config['copyright_text']
+    counts = {'files': 0, 'bytes': 0, 'binary': 0, 'shbang': 0, 'header': 0}
+
+    dirs = max(1, spec.files // FILES_PER_DIR)
+    for i in range(spec.files):
+        d = rng.randrange(dirs)
+        directory = root / f"d{d % 10}" / f"d{d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        size = min(spec.size_max,
+                   int(rng.lognormvariate(math.log(spec.size_median), spec.size_sigma)))
+
+        if rng.random() < spec.binary_ratio:
+            data = b'\x89PNG\r\n\x1a\n' + rng.randbytes(size)
+            (directory / f"image_{i}.png").write_bytes(data)
+            counts['binary'] += 1
+            counts['files'] += 1
+            counts['bytes'] += len(data)
+            continue
+
+        lang = rng.choices(names, weights)[0]
+        spec_lang = languages[lang]
+        name = f"file_{i}.{rng.choice(spec_lang['extensions'])}"
+        lead = b''
+        patterns = spec_lang.get('shbang_patterns')
+        if patterns and rng.random() < spec.shbang_ratio:
+            lead = f"#!/usr/bin/env {rng.choice(patterns)}\n".encode('ascii')
+            counts['shbang'] += 1
+            if rng.random() < 0.5:
+                # Extensionless scripts are classified by shbang alone
+                name = f"script_{i}"
+        if rng.random() < spec.header_ratio:
+            prefix = spec_lang.get('prefix', '')
+            suffix = spec_lang.get('suffix', '')
+            lead += f"{prefix}{copyright_text}{suffix}\n\n".encode('utf-8')
+            counts['header'] += 1
+
+        start = offsets[rng.randrange(len(offsets))]
+        body = filler[start:start + size]
+        if body and not body.endswith(b'\n'):
+            body = body[:body.rfind(b'\n') + 1]
+        data = lead + body
+        (directory / name).write_bytes(data)
+        counts['files'] += 1
+        counts['bytes'] += len(data)
+
+    return counts
+
+def install_tool(tool: Path, workdir: Path, config: Dict[str, Any]) -> Path:
+    """Copy an updater into workdir next to a config.yaml it understands."""
+    import yaml
+    workdir.mkdir(parents=True, exist_ok=True)
+    script = workdir / tool.name
+    shutil.copy2(tool, script)
+    tool_config = config if tool.name == NEW_TOOL else legacy_config(config)
+    with open(workdir / 'config.yaml', 'w', encoding='utf-8') as f:
+        yaml.safe_dump(tool_config, f, sort_keys=False)
+    return script
+
+def run_once(script: Path, tree: Path, mode: str, extra_args: List[str],
+             report: Optional[Path]) -> Dict[str, Any]:
+    """Run an updater once and measure its wall and CPU time."""
+    cmd = [sys.executable, str(script), str(tree), mode]
+    if script.name == NEW_TOOL:
+        cmd += extra_args
+        if report is not None:
+            cmd += ['--report', str(report)]
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=script.parent, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'wall': wall,
+        'user': after.ru_utime - before.ru_utime,
+        'system': after.ru_stime - before.ru_stime,
+        'returncode': proc.returncode,
+    }
+
+def benchmark_tool(tool: Path, workdir: Path, spec: TreeSpec, config: Dict[str, Any],
+                   repeat: int, extra_args: List[str]) -> List[Dict[str, Any]]:
+    """Time one updater in each mode, on a fresh tree for every run."""
+    script = install_tool(tool, workdir / 'tool', config)
+    tree = workdir / 'tree'
+    report = workdir / 'report.json'
+    results = []
+    for mode in MODES:
+        samples = []
+        stages = None
+        for _ in range(repeat):
+            if tree.exists():
+                shutil.rmtree(tree)
+            generate_tree(tree, spec, config)
+            sample = run_once(script, tree, mode, extra_args, report)
+            samples.append(sample)
+            if report.exists():
+                with open(report, 'r', encoding='utf-8') as f:
+                    stages = json.load(f)
+                report.unlink()
+        walls = [sample['wall'] for sample in samples]
+        results.append({
+            'tool': str(tool.relative_to(BENCH_DIR)) if tool.is_relative_to(BENCH_DIR) else str(tool),
+            'mode': mode,
+            'args': extra_args if tool.name == NEW_TOOL else [],
+            'wall_median': statistics.median(walls),
+            'wall_min': min(walls),
+            'files_per_second': spec.files / statistics.median(walls),
+            'failures': sum(1 for sample in samples if sample['returncode'] != 0),
+            'samples': samples,
+            'report': stages,
+        })
+        logging.info("%-24s %-7s median %8.3fs  min %8.3fs  %10.1f files/s",
+                     results[-1]['tool'], mode, results[-1]['wall_median'],
+                     results[-1]['wall_min'], results[-1]['files_per_second'])
+        if results[-1]['failures']:
+            logging.warning("%s %s: %d of %d runs exited non-zero", results[-1]['tool'], mode,
+                            results[-1]['failures'], repeat)
+    return results
+
+def git_revision() -> Optional[str]:
+    """Return the checked-out commit, if the benchmark runs from a git tree."""
+    try:
+        proc = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip()
+
+def parse_mix(text: Optional[str]) -> Optional[Dict[str, float]]:
+    """Parse 'python=5,shell=2' into language weights."""
+    if not text:
+        return None
+    mix = {}
+    for item in text.split(','):
+        lang, _, weight = item.partition('=')
+        mix[lang.strip()] = float(weight) if weight else 1.0
+    return mix
+
+def main() -> None:
+    """Main entry point for the benchmark."""
+    defaults = TreeSpec._field_defaults
+    parser = argparse.ArgumentParser(description='Benchmark the copyright header updaters.')
+    parser.add_argument("--tool", action='append', default=None,
+                      help="Updater to benchmark, relative to this directory (repeatable; "
+                           "default: v3, v4, v5 and updater_new.py)")
+    parser.add_argument("--new-args", default='',
+                      help="Extra arguments for updater_new.py, e.g. \"-j 8 --dedup\"")
+    parser.add_argument("--config", default=str(BENCH_DIR / 'config3.yaml'),
+                      help="Configuration providing the language mix (default: config3.yaml)")
+    parser.add_argument("--files", type=int, default=defaults['files'],
+                      help=f"Number of files to generate (default: {defaults['files']})")
+    parser.add_argument("--seed", type=int, default=defaults['seed'],
+                      help="Generator seed; equal seeds give identical trees")
+    parser.add_argument("--mix", default=None,
+                      help="Language weights, e.g. python=5,shell=2 (default: every language equally)")
+    parser.add_argument("--size-median", type=int, default=defaults['size_median'],
+                      help=f"Median file size in bytes (default: {defaults['size_median']})")
+    parser.add_argument("--size-sigma", type=float, default=defaults['size_sigma'],
+                      help=f"Log-normal spread of file sizes (default: {defaults['size_sigma']})")
+    parser.add_argument("--size-max", type=int, default=defaults['size_max'],
+                      help=f"Largest file size in bytes (default: {defaults['size_max']})")
+    parser.add_argument("--shbang-ratio", type=float, default=defaults['shbang_ratio'],
+                      help=f"Fraction of scripts starting with a shbang (default: {defaults['shbang_ratio']})")
+    parser.add_argument("--binary-ratio", type=float, default=defaults['binary_ratio'],
+                      help=f"Fraction of binary files (default: {defaults['binary_ratio']})")
+    parser.add_argument("--header-ratio", type=float, default=defaults['header_ratio'],
+                      help=f"Fraction of files that already have a header (default: {defaults['header_ratio']})")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                      help="Runs per tool and mode; the median is reported (default: 3)")
+    parser.add_argument("--workdir", default=None,
+                      help="Scratch directory (default: a temporary directory, removed afterwards)")
+    parser.add_argument("-o", "--output", default=None,
+                      help="Results file (default: benchmark_YYYYmmdd_HHMMSS.json)")
+    parser.add_argument("--generate-only", metavar='DIR', default=None,
+                      help="Only write the generated tree to DIR and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    config = load_languages(Path(args.config))
+    spec = TreeSpec(files=args.files, seed=args.seed, mix=parse_mix(args.mix),
+                    size_median=args.size_median, size_sigma=args.size_sigma,
+                    size_max=args.size_max, shbang_ratio=args.shbang_ratio,
+                    binary_ratio=args.binary_ratio, header_ratio=args.header_ratio)
+
+    if args.generate_only:
+        counts = generate_tree(Path(args.generate_only), spec, config)
+        logging.info("Generated %s: %s", args.generate_only, counts)
+        return
+
+    if args.repeat < 1:
+        logging.error("Invalid repeat count: %d", args.repeat)
+        sys.exit(1)
+
+    tools = [BENCH_DIR / tool for tool in (args.tool or DEFAULT_TOOLS)]
+    for tool in tools:
+        if not tool.is_file():
+            logging.error("Updater not found: %s", tool)
+            sys.exit(1)
+
+    scratch = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='bench-'))
+    try:
+        counts = generate_tree(scratch / 'probe', spec, config)
+        shutil.rmtree(scratch / 'probe')
+        logging.info("Tree: %d files, %d bytes (%d binary, %d shbang, %d with header)",
+                     counts['files'], counts['bytes'], counts['binary'],
+                     counts['shbang'], counts['header'])
+        results = []
+        for index, tool in enumerate(tools):
+            results += benchmark_tool(tool, scratch / f"run{index}", spec, config,
+                                      args.repeat, shlex.split(args.new_args))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    output = args.output or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    document = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'tree': dict(spec._asdict(), **counts),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    logging.info("Results written to %s", output)
+
+if __name__ == "__main__":
+    main()